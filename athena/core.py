@@ -0,0 +1,654 @@
+import streamlit as st
+import asyncio
+import atexit
+import queue
+import threading
+import time
+import httpx
+from openai import AsyncOpenAI
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Google Sheets setup
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+SHEETS_TIMEOUT = 10
+SHEETS_API = 'https://sheets.googleapis.com/v4/spreadsheets'
+
+# Deployment settings, read from secrets once per server process
+SPREADSHEET_ID = st.secrets.get("SPREADSHEET_ID", "")
+
+# Speculatively run both assistants alongside the labeler when enabled, at the cost of an extra run.
+# Secrets may arrive as strings, so "false" must not count as enabled
+SPECULATIVE = str(st.secrets.get("SPECULATIVE", False)).strip().lower() in ("1", "true", "yes")
+
+# Route questions through the labeler, or set ASSISTANT_MODE to "single" to use one assistant
+ASSISTANT_MODE = str(st.secrets.get("ASSISTANT_MODE", "dual")).strip().lower()
+if ASSISTANT_MODE not in ("single", "dual"):
+    logger.warning(f"Unknown ASSISTANT_MODE {ASSISTANT_MODE!r}, using dual")
+    ASSISTANT_MODE = "dual"
+
+# One keep-alive HTTP/2 connection pool is shared by every OpenAI call
+OPENAI_TIMEOUT = 60
+OPENAI_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+
+# Rate limited requests are retried with jittered exponential backoff, honoring Retry-After
+OPENAI_MAX_RETRIES = 5
+
+# Rough token cost of one assistant run beyond the question itself, for rate limiting
+RUN_TOKEN_ESTIMATE = 4000
+
+# Log timestamps are recorded in Pacific time
+PST = ZoneInfo('America/Los_Angeles')
+
+# Write queued log rows in batches of up to this many, at most this many seconds apart
+LOG_BATCH_SIZE = 50
+LOG_FLUSH_INTERVAL = 5
+
+# On shutdown, wait this many seconds for the writer to send the rows it holds
+LOG_SHUTDOWN_TIMEOUT = 2 * SHEETS_TIMEOUT
+
+# Queued in place of a row to wake the writer when the server shuts down
+LOG_SHUTDOWN = None
+
+# Reuse labeler decisions for this many seconds, keeping at most this many questions
+LABEL_CACHE_TTL = 3600
+LABEL_CACHE_SIZE = 1024
+
+# Reuse answers to a session's opening question for this many seconds, keeping at most this many
+RESPONSE_CACHE_TTL = 3600
+RESPONSE_CACHE_SIZE = 1024
+
+# SUNet IDs are 3-8 letters and digits starting with a letter, optionally as a Stanford email
+SUNET_RE = re.compile(r'^[a-z][a-z0-9]{2,7}(@stanford\.edu)?$')
+
+# File search citations and style tags the assistants leave in their replies
+RESPONSE_MARKUP_RE = re.compile(r'【\d+:\d+†source】|<userStyle>Normal</userStyle>')
+
+# Reruns scoped to part of the page need Streamlit 1.33+; older versions rerun everything
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", lambda func: func)
+
+# Autofill prompts shown on an empty chat
+SUGGESTED_PROMPTS = [
+    "What classes should I take as a History major?",
+    "What classes can I take to fulfill WAYS A-II?",
+    "What are some afternoon classes I can take?"
+]
+
+@st.cache_resource
+def get_google_credentials():
+    """Load the service account credentials for Google Sheets"""
+    # Google client libraries are slow to import, so load them only once Sheets is needed
+    from google.oauth2.service_account import Credentials
+
+    return Credentials.from_service_account_info(
+        st.secrets["gcp_service_account"],
+        scopes=SCOPES
+    )
+
+def authorized_session(credentials):
+    """Create a reusable keep-alive session that signs requests with the credentials"""
+    from google.auth.transport.requests import AuthorizedSession
+
+    return AuthorizedSession(credentials)
+
+@st.cache_resource
+def get_google_sheets_service():
+    """Initialize Google Sheets service"""
+    try:
+        logger.debug("Attempting to connect to Google Sheets...")
+
+        credentials = get_google_credentials()
+
+        # Call the Sheets REST API directly rather than loading its discovery document
+        service = authorized_session(credentials)
+        logger.debug("Successfully built Google Sheets service")
+
+        return service
+    except Exception as e:
+        # Log the error to the console but don't display it to the user
+        logger.error(f"Failed to connect to Google Sheets: {str(e)}")
+        return None
+
+@st.cache_resource
+def get_log_queue(_service, spreadsheet_id):
+    """Start the background writer that appends queued rows to Google Sheets"""
+    log_queue = queue.Queue()
+    stop = threading.Event()
+
+    # Sessions aren't guaranteed thread-safe, so the writer gets its own
+    writer_service = authorized_session(get_google_credentials())
+    writer = threading.Thread(
+        target=log_writer,
+        args=(log_queue, writer_service, spreadsheet_id, stop),
+        daemon=True
+    )
+    writer.start()
+
+    # Let the writer finish its batch, then write out anything still queued, when the server shuts down
+    atexit.register(flush_logs, log_queue, _service, spreadsheet_id, stop, writer)
+
+    return log_queue
+
+def drain(log_queue, max_rows, timeout):
+    """Collect up to max_rows queued rows, waiting at most timeout seconds or until shutdown"""
+    rows = []
+    deadline = time.monotonic() + timeout
+    while len(rows) < max_rows:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            row = log_queue.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if row is LOG_SHUTDOWN:
+            break
+        rows.append(row)
+    return rows
+
+def log_writer(log_queue, service, spreadsheet_id, stop):
+    """Make sure the sheet has headers, then append queued rows in batches until shutdown"""
+    headers_written = write_headers_if_missing(service, spreadsheet_id)
+    while True:
+        rows = drain(log_queue, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL)
+        if rows:
+            # Retry the headers if the first check failed, so they land above these rows
+            if not headers_written:
+                headers_written = write_headers_if_missing(service, spreadsheet_id)
+            append_rows(service, spreadsheet_id, rows)
+
+        # Only stop once the batch in hand has been sent
+        if stop.is_set():
+            break
+
+def flush_logs(log_queue, service, spreadsheet_id, stop, writer):
+    """Stop the writer, then append every row still waiting in the queue"""
+    stop.set()
+    log_queue.put(LOG_SHUTDOWN)
+    writer.join(timeout=LOG_SHUTDOWN_TIMEOUT)
+    if writer.is_alive():
+        logger.error("Log writer didn't stop in time, some interactions may be lost")
+        return
+
+    rows = []
+    while True:
+        try:
+            row = log_queue.get_nowait()
+        except queue.Empty:
+            break
+        if row is not LOG_SHUTDOWN:
+            rows.append(row)
+    if rows:
+        append_rows(service, spreadsheet_id, rows)
+
+def append_rows(service, spreadsheet_id, rows):
+    """Append interaction rows to Google Sheets in a single call"""
+    try:
+        logger.debug("Attempting to log %s interactions...", len(rows))
+
+        # Append the rows to the sheet
+        body = {
+            'values': rows
+        }
+
+        response = service.post(
+            f"{SHEETS_API}/{spreadsheet_id}/values/Logs!A:G:append",  # Extended range to include assistant type
+            params={'valueInputOption': 'RAW', 'insertDataOption': 'INSERT_ROWS'},
+            json=body,
+            timeout=SHEETS_TIMEOUT
+        )
+        response.raise_for_status()
+
+        logger.debug("Successfully logged interactions to Google Sheets")
+        return True
+    except Exception as e:
+        # Log the error but don't display it to the user
+        logger.error(f"Failed to log interactions: {str(e)}")
+        return False
+
+def log_interaction(service, spreadsheet_id, user_message, assistant_response, sunet_id, assistant_type):
+    """Queue an interaction for Google Sheets with assistant type"""
+    if not service:
+        # Silently fail without showing errors to user
+        logger.error("Google Sheets service not initialized")
+        return False
+
+    # ISO 8601 with the UTC offset, which also records whether daylight saving was in effect
+    current_time = datetime.now(PST).isoformat(sep=' ', timespec='seconds')
+
+    try:
+        # Hand the finished row to the background writer, which sends it as is
+        get_log_queue(service, spreadsheet_id).put((
+            current_time,
+            sunet_id,
+            user_message,
+            assistant_response,
+            len(user_message),
+            len(assistant_response),
+            assistant_type  # Add assistant type to logging
+        ))
+        return True
+    except Exception as e:
+        # Never let logging break the chat, just record why it failed
+        logger.error(f"Failed to queue interaction: {str(e)}")
+        return False
+
+def initialize_sheet_if_needed(service, spreadsheet_id):
+    """Initialize the sheet with headers if it's new"""
+    if not service:
+        # Skip silently if service is not available
+        logger.error("Google Sheets service not initialized")
+        return
+
+    try:
+        # Starting the background writer checks the headers without holding up the page
+        get_log_queue(service, spreadsheet_id)
+    except Exception as e:
+        # Log error but don't display to user
+        logger.error(f"Error checking/initializing sheet: {str(e)}")
+
+def write_headers_if_missing(service, spreadsheet_id):
+    """Add the header row to an empty sheet"""
+    headers = [
+        ['Timestamp', 'SUNet ID', 'User Message', 'Assistant Response', 
+        'Message Length', 'Response Length', 'Assistant Type']
+    ]
+
+    try:
+        # Check if headers exist
+        response = service.get(
+            f"{SHEETS_API}/{spreadsheet_id}/values:batchGet",
+            params={'ranges': 'Logs!A1:G1'},
+            timeout=SHEETS_TIMEOUT
+        )
+        response.raise_for_status()
+        result = response.json()
+
+        if not result['valueRanges'][0].get('values'):
+            # Sheet is empty, add headers
+            body = {
+                'values': headers
+            }
+            service.put(
+                f"{SHEETS_API}/{spreadsheet_id}/values/Logs!A1:G1",
+                params={'valueInputOption': 'RAW'},
+                json=body,
+                timeout=SHEETS_TIMEOUT
+            ).raise_for_status()
+
+        return True
+    except Exception as e:
+        # Log error but don't display to user
+        logger.error(f"Error checking/initializing sheet: {str(e)}")
+        return False
+
+def validate_sunet(sunet_id):
+    """Validate SUNet ID format"""
+    return bool(SUNET_RE.match((sunet_id or '').lower()))
+
+def normalize_sunet(sunet_id):
+    """Reduce a valid SUNet ID or Stanford email to the bare lowercase ID"""
+    return sunet_id.lower().split('@')[0]
+
+def clean_response(response):
+    """Strip source markers and style tags from an assistant reply"""
+    return RESPONSE_MARKUP_RE.sub('', response).strip()
+
+@st.cache_resource
+def get_event_loop():
+    """Start the background event loop shared by all sessions"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+def run_async(coro):
+    """Run a coroutine on the shared event loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+class RateLimiter:
+    """Space out requests to stay under per-minute request and token limits"""
+
+    def __init__(self, max_rpm, max_tpm):
+        self.max_rpm = max_rpm
+        self.max_tpm = max_tpm
+        self.requests = max_rpm
+        self.tokens = max_tpm
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.requests = min(self.max_rpm, self.requests + elapsed * self.max_rpm / 60)
+        self.tokens = min(self.max_tpm, self.tokens + elapsed * self.max_tpm / 60)
+        self.updated = now
+
+    async def acquire(self, tokens):
+        """Wait until a request costing this many tokens fits under both limits"""
+        tokens = min(tokens, self.max_tpm)
+        async with self.lock:
+            while True:
+                self.refill()
+                if self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1
+                    self.tokens -= tokens
+                    return
+
+                # Sleep until whichever limit is short has refilled enough
+                wait = 0
+                if self.requests < 1:
+                    wait = (1 - self.requests) * 60 / self.max_rpm
+                if self.tokens < tokens:
+                    wait = max(wait, (tokens - self.tokens) * 60 / self.max_tpm)
+                await asyncio.sleep(wait)
+
+@st.cache_resource
+def get_rate_limiter():
+    """Shared OpenAI rate limiter, or None when no limits are configured"""
+    max_rpm = st.secrets.get("OPENAI_MAX_RPM")
+    max_tpm = st.secrets.get("OPENAI_MAX_TPM")
+    if not max_rpm and not max_tpm:
+        return None
+    return RateLimiter(max_rpm or float("inf"), max_tpm or float("inf"))
+
+# Cached per argument list, so every page passes the mode the same way to share one client
+@st.cache_resource
+def initialize_assistants(mode):
+    """Connect to OpenAI and retrieve the labeler and both responders, or the one assistant in single mode"""
+    # Keep connections open so later calls skip the TCP and TLS handshakes
+    http_client = httpx.AsyncClient(http2=True, limits=OPENAI_LIMITS, timeout=OPENAI_TIMEOUT)
+    client = AsyncOpenAI(
+        api_key=st.secrets["OPENAI_API_KEY"],
+        http_client=http_client,
+        max_retries=OPENAI_MAX_RETRIES
+    )
+
+    if mode == "single":
+        # One assistant answers everything, so there's no labeler to retrieve
+        assistant, = run_async(retrieve_assistants(client, [st.secrets["ASSISTANT_KEY"]]))
+        return client, None, assistant, assistant
+
+    # Initialize all assistants concurrently
+    labeler, course_scheduler, admin_info = run_async(retrieve_assistants(client, [
+        st.secrets["LABELER_ID"],
+        st.secrets["COURSE_SCHEDULER_ID"],
+        st.secrets["ADMIN_INFO_ID"]
+    ]))
+
+    return client, labeler, course_scheduler, admin_info
+
+async def retrieve_assistants(client, assistant_ids):
+    """Retrieve several assistants at once"""
+    return await asyncio.gather(*(
+        client.beta.assistants.retrieve(assistant_id) for assistant_id in assistant_ids
+    ))
+
+async def run_assistant(client, run_stream, on_delta=None):
+    """Stream a run to completion and get its response and final state"""
+    discarded = asyncio.Event()
+
+    async def consume():
+        response = ""
+
+        # Stream the run instead of polling for its status
+        async with run_stream as stream:
+            async for event in stream:
+                if discarded.is_set():
+                    # Stop the run server-side so a discarded answer stops using tokens
+                    run = stream.current_run
+                    if run is not None:
+                        await client.beta.threads.runs.cancel(
+                            thread_id=run.thread_id,
+                            run_id=run.id
+                        )
+                        return response, run
+                    continue
+
+                if event.event == "thread.message.delta":
+                    for content in event.data.delta.content or []:
+                        if content.type == "text" and content.text and content.text.value:
+                            response += content.text.value
+                            if on_delta:
+                                on_delta(content.text.value)
+            return response, stream.current_run
+
+    # Shield the stream so cancelling us can't interrupt it before the run is known
+    consumer = asyncio.ensure_future(consume())
+    try:
+        response, run = await asyncio.shield(consumer)
+
+        if run is None or run.status != 'completed':
+            raise Exception(f"Assistant run {run.status if run else 'failed'}")
+
+        return response, run
+
+    except asyncio.CancelledError:
+        discarded.set()
+        try:
+            await asyncio.shield(consumer)
+        except Exception as e:
+            logger.error(f"Error cancelling run: {str(e)}")
+        raise
+
+    except Exception as e:
+        logger.error(f"Error running assistant: {str(e)}")
+        raise
+
+class DeltaRelay:
+    """Hold back streamed text until released, then pass it on"""
+
+    def __init__(self, on_delta):
+        self.on_delta = on_delta
+        self.pending = []
+        self.released = False
+
+    def __call__(self, text):
+        if self.released:
+            self.on_delta(text)
+        else:
+            self.pending.append(text)
+
+    def release(self):
+        self.released = True
+        for text in self.pending:
+            self.on_delta(text)
+        self.pending = []
+
+async def ask_assistant(client, assistant_id, user_question, thread_ids=None, on_delta=None, rate_limiter=None, response_cache=None):
+    """Run the assistant on the user's question in a single request"""
+    question = {"role": "user", "content": user_question}
+    thread_id = thread_ids.get(assistant_id) if thread_ids is not None else None
+
+    # Opening questions don't depend on earlier turns, so repeats can reuse an answer
+    if thread_ids is None or thread_id:
+        response_cache = None
+    if response_cache is not None:
+        response = cached_response(response_cache, assistant_id, user_question)
+        if response is not None:
+            # Record the exchange on a new thread so follow-ups keep their context
+            thread = await client.beta.threads.create(
+                messages=[question, {"role": "assistant", "content": response}]
+            )
+            thread_ids[assistant_id] = thread.id
+            if on_delta:
+                on_delta(response)
+            return response
+
+    # Wait for room under the configured OpenAI limits before starting the run
+    if rate_limiter:
+        await rate_limiter.acquire(len(user_question) // 4 + RUN_TOKEN_ESTIMATE)
+
+    if thread_id:
+        # Continue the session's existing conversation with this assistant
+        run_stream = client.beta.threads.runs.stream(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            additional_messages=[question]
+        )
+    else:
+        # Create a thread holding the question and start the run together
+        run_stream = client.beta.threads.create_and_run_stream(
+            assistant_id=assistant_id,
+            thread={"messages": [question]}
+        )
+
+    response, run = await run_assistant(client, run_stream, on_delta)
+    if thread_ids is not None:
+        thread_ids[assistant_id] = run.thread_id
+
+    if response_cache is not None:
+        # Evict the oldest answer once the cache is full
+        if len(response_cache) >= RESPONSE_CACHE_SIZE:
+            response_cache.pop(next(iter(response_cache)))
+        response_cache[(assistant_id, normalize_question(user_question))] = (response, time.monotonic())
+
+    return response
+
+@st.cache_resource
+def get_label_cache():
+    """Labeler decisions shared by all sessions, keyed by normalized question"""
+    return {}
+
+@st.cache_resource
+def warm_label_cache(_client, _labeler):
+    """Label the suggested prompts in the background, once per server process"""
+    label_cache = get_label_cache()
+    rate_limiter = get_rate_limiter()
+    for prompt in SUGGESTED_PROMPTS:
+        asyncio.run_coroutine_threadsafe(
+            get_label(_client, _labeler, label_cache, prompt, rate_limiter),
+            get_event_loop()
+        )
+    return True
+
+@st.cache_resource
+def get_response_cache():
+    """Answers to opening questions shared by all sessions, keyed by assistant and normalized question"""
+    return {}
+
+def cached_response(response_cache, assistant_id, user_question):
+    """Return a recent answer from this assistant to this opening question, if there is one"""
+    entry = response_cache.get((assistant_id, normalize_question(user_question)))
+    if entry and time.monotonic() - entry[1] < RESPONSE_CACHE_TTL:
+        return entry[0]
+    return None
+
+def normalize_question(user_question):
+    """Lowercase and collapse whitespace so trivially different questions match"""
+    return " ".join(user_question.lower().split())
+
+def cached_label(label_cache, user_question):
+    """Return a recent labeler decision for this question, if there is one"""
+    entry = label_cache.get(normalize_question(user_question))
+    if entry and time.monotonic() - entry[1] < LABEL_CACHE_TTL:
+        return entry[0]
+    return None
+
+async def get_label(client, labeler, label_cache, user_question, rate_limiter=None):
+    """Run the labeler and remember its decision for this question"""
+    label = int(await ask_assistant(client, labeler.id, user_question, rate_limiter=rate_limiter))
+
+    # Evict the oldest question once the cache is full
+    if len(label_cache) >= LABEL_CACHE_SIZE:
+        label_cache.pop(next(iter(label_cache)))
+    label_cache[normalize_question(user_question)] = (label, time.monotonic())
+
+    return label
+
+async def process_user_query(client, thread_ids, label_cache, labeler, course_scheduler, admin_info, user_question, speculative=False, on_delta=None, mode="dual", rate_limiter=None, response_cache=None):
+    """Process user query through dual assistant system, or straight to the one assistant in single mode"""
+    # Only a session's opening question stands on its own; once any assistant
+    # has a thread, answers may depend on earlier turns and mustn't be shared
+    if thread_ids:
+        response_cache = None
+
+    tasks = []
+    try:
+        if mode == "single":
+            # Nothing to choose between, so skip the labeler
+            final_response = await ask_assistant(
+                client, course_scheduler.id, user_question, thread_ids, on_delta, rate_limiter, response_cache
+            )
+            return final_response, "Course Helper"
+
+        # Skip the labeler when this question was labeled recently
+        label = cached_label(label_cache, user_question)
+
+        # Speculate only for assistants this session hasn't talked to yet, each on a
+        # thread of its own, so a discarded run never lands in the conversation
+        candidates = {}
+        if label is None and speculative:
+            for assistant in (course_scheduler, admin_info):
+                if assistant.id not in thread_ids:
+                    relay = DeltaRelay(on_delta or (lambda text: None))
+                    threads = {}
+                    task = asyncio.create_task(ask_assistant(
+                        client, assistant.id, user_question, threads, relay, rate_limiter, response_cache
+                    ))
+                    candidates[assistant.id] = (task, relay, threads)
+                    tasks.append(task)
+
+        if label is None:
+            # Get labeler's decision on a thread of its own
+            label = await get_label(client, labeler, label_cache, user_question, rate_limiter)
+
+        # Choose next assistant based on label
+        next_assistant = course_scheduler if label == 1 else admin_info
+        assistant_type = "Course Scheduler" if label == 1 else "Admin Info"
+
+        # Keep the chosen assistant's speculative run, if any, and cancel the rest
+        chosen = candidates.pop(next_assistant.id, None)
+        for task, _, _ in candidates.values():
+            task.cancel()
+
+        if chosen is not None:
+            task, relay, threads = chosen
+            relay.release()
+            final_response = await task
+            thread_ids.update(threads)
+        else:
+            # Get final response from chosen assistant
+            final_response = await ask_assistant(
+                client, next_assistant.id, user_question, thread_ids, on_delta, rate_limiter, response_cache
+            )
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return final_response, assistant_type
+
+    except Exception as e:
+        # Don't leave speculative runs going after a failure
+        for task in tasks:
+            task.cancel()
+        error_msg = f"Error processing query: {str(e)}"
+        logger.error(error_msg)
+        return error_msg, "Error"
+
+def stream_user_query(message_placeholder, client, thread_ids, label_cache, labeler, course_scheduler, admin_info, user_question, speculative=False, render=None, mode="dual"):
+    """Process user query, showing the response in the placeholder as it streams in"""
+    # Look up shared resources here, since Streamlit's cache needs the script thread
+    rate_limiter = get_rate_limiter()
+    response_cache = get_response_cache()
+
+    deltas = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(
+        process_user_query(
+            client, thread_ids, label_cache, labeler, course_scheduler, admin_info, user_question,
+            speculative=speculative, on_delta=deltas.put, mode=mode,
+            rate_limiter=rate_limiter, response_cache=response_cache
+        ),
+        get_event_loop()
+    )
+    future.add_done_callback(lambda _: deltas.put(None))
+
+    # Render text as it arrives until the query finishes
+    render = render or message_placeholder.markdown
+    streamed = ""
+    for text in iter(deltas.get, None):
+        streamed += text
+        render(streamed + "▌")
+
+    return future.result()
@@ -1,20 +1,22 @@
 import streamlit as st
 import time
-from openai import OpenAI
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from datetime import datetime
-import pytz
-import logging
-import re
 import base64
-
-# Set up logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-# Google Sheets setup
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+import uuid
+from athena.core import (
+    ASSISTANT_MODE,
+    SPECULATIVE,
+    SPREADSHEET_ID,
+    clean_response,
+    fragment,
+    get_google_sheets_service,
+    get_label_cache,
+    initialize_assistants,
+    initialize_sheet_if_needed,
+    log_interaction,
+    normalize_sunet,
+    stream_user_query,
+    validate_sunet
+)
 
 # Initialize session state for login
 if "authenticated" not in st.session_state:
@@ -186,6 +188,33 @@ def display_logo():
     # </div>
     # """, unsafe_allow_html=True)
 
+# Chat message bubble for either side of the conversation
+def message_html(role, content):
+    if role == "user":
+        return f"""
+    <div class="user-message">
+        <strong>You:</strong><br>{content}
+    </div>
+    """
+    return f"""
+    <div class="assistant-message">
+        <strong>Course Helper:</strong><br>{content}
+    </div>
+    """
+
+# Add a message to the chat history under a new id
+def add_message(role, content):
+    message = {"id": uuid.uuid4().hex, "role": role, "content": content}
+    st.session_state.messages.append(message)
+    return message
+
+# Chat bubble HTML for a message, formatted once and reused on later reruns
+def rendered_html(message):
+    rendered = st.session_state.rendered
+    if message["id"] not in rendered:
+        rendered[message["id"]] = message_html(message["role"], message["content"])
+    return rendered[message["id"]]
+
 # Loading animation component
 def loading_animation():
     return st.markdown("""
@@ -196,116 +225,6 @@ def loading_animation():
     </div>
     """, unsafe_allow_html=True)
 
-@st.cache_resource
-def get_google_sheets_service():
-    """Initialize Google Sheets service"""
-    try:
-        logger.info("Attempting to connect to Google Sheets...")
-        
-        credentials = Credentials.from_service_account_info(
-            st.secrets["gcp_service_account"],
-            scopes=SCOPES
-        )
-        
-        service = build('sheets', 'v4', credentials=credentials)
-        
-        # Test the connection
-        spreadsheet_id = st.secrets["SPREADSHEET_ID"]
-        result = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-        logger.info(f"Successfully accessed spreadsheet: {spreadsheet_id}")
-        
-        return service
-    except Exception as e:
-        error_msg = f"Failed to connect to Google Sheets: {str(e)}"
-        st.error(error_msg)
-        logger.error(error_msg)
-        return None
-
-def log_interaction(service, spreadsheet_id, user_message, assistant_response, sunet_id, assistant_type):
-    """Log interaction to Google Sheets with assistant type"""
-    if not service:
-        error_msg = "Google Sheets service not initialized"
-        st.error(error_msg)
-        logger.error(error_msg)
-        return False
-        
-    try:
-        logger.info("Attempting to log interaction...")
-        
-        # Get PST timezone
-        pst = pytz.timezone('America/Los_Angeles')
-        current_time = datetime.now(pst).strftime('%Y-%m-%d %H:%M:%S %Z')
-        
-        # Prepare the row data
-        row_data = [
-            [
-                current_time,
-                sunet_id,
-                user_message,
-                assistant_response,
-                len(user_message),
-                len(assistant_response),
-                assistant_type  # Add assistant type to logging
-            ]
-        ]
-        
-        # Append the row to the sheet
-        body = {
-            'values': row_data
-        }
-        
-        result = service.spreadsheets().values().append(
-            spreadsheetId=spreadsheet_id,
-            range='Logs!A:G',  # Extended range to include assistant type
-            valueInputOption='RAW',
-            insertDataOption='INSERT_ROWS',
-            body=body
-        ).execute()
-        
-        logger.info("Successfully logged interaction to Google Sheets")
-        return True
-    except Exception as e:
-        error_msg = f"Failed to log interaction: {str(e)}"
-        st.error(error_msg)
-        logger.error(error_msg)
-        return False
-
-def initialize_sheet_if_needed(service, spreadsheet_id):
-    """Initialize the sheet with headers if it's new"""
-    if not service:
-        st.error("Google Sheets service not initialized")
-        return
-        
-    try:
-        headers = [
-            ['Timestamp', 'SUNet ID', 'User Message', 'Assistant Response', 
-             'Message Length', 'Response Length', 'Assistant Type']
-        ]
-        
-        # Check if headers exist
-        result = service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range='Logs!A1:G1'
-        ).execute()
-        
-        if 'values' not in result:
-            # Sheet is empty, add headers
-            body = {
-                'values': headers
-            }
-            service.spreadsheets().values().update(
-                spreadsheetId=spreadsheet_id,
-                range='Logs!A1:G1',
-                valueInputOption='RAW',
-                body=body
-            ).execute()
-    except Exception as e:
-        st.error(f"❌ Error checking/initializing sheet: {str(e)}")
-
-def validate_sunet(sunet_id):
-    """Validate SUNet ID format"""
-    return True;
-
 def login_page():
     # Apply custom CSS
     local_css()
@@ -351,7 +270,7 @@ def login_page():
                     
                     if validate_sunet(sunet_id):
                         st.session_state.authenticated = True
-                        st.session_state.sunet_id = sunet_id
+                        st.session_state.sunet_id = normalize_sunet(sunet_id)
                         st.success("Login successful!")
                         time.sleep(0.5)
                         st.rerun()
@@ -367,82 +286,66 @@ def login_page():
     </div>
     """, unsafe_allow_html=True)
 
-@st.cache_resource
-def initialize_assistants():
-    client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-    
-    # Initialize all assistants
-    labeler = client.beta.assistants.retrieve(st.secrets["LABELER_ID"])
-    course_scheduler = client.beta.assistants.retrieve(st.secrets["COURSE_SCHEDULER_ID"])
-    admin_info = client.beta.assistants.retrieve(st.secrets["ADMIN_INFO_ID"])
-    
-    # Create initial thread
-    thread = client.beta.threads.create()
-    
-    return client, labeler, course_scheduler, admin_info, thread
+@fragment
+def chat_turn(client, labeler, course_scheduler, admin_info, label_cache, sheets_service, shown):
+    """Handle chat input without rerunning the rest of the page"""
+    # Redraw messages sent since the rest of the page was last drawn
+    for message in st.session_state.messages[shown:]:
+        st.markdown(rendered_html(message), unsafe_allow_html=True)
 
-def run_assistant(client, thread_id, assistant_id):
-    """Run an assistant and get its response"""
-    try:
-        # Start the run
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id
-        )
-        
-        # Wait for completion
-        while True:
-            run_status = client.beta.threads.runs.retrieve(
-                thread_id=thread_id,
-                run_id=run.id
+    # Chat input
+    user_input = st.chat_input("Ask about courses or academic policies...")
+
+    if user_input:
+        # Add user message to chat history and show it right away
+        user_message = add_message("user", user_input)
+        st.markdown(rendered_html(user_message), unsafe_allow_html=True)
+
+        # Display loading animation until the response starts streaming in
+        response_placeholder = st.empty()
+        with response_placeholder:
+            loading_animation()
+
+        try:
+            # Process through the assistants, streaming into the placeholder
+            response, assistant_type = stream_user_query(
+                response_placeholder,
+                client, st.session_state.thread_ids, label_cache, labeler, course_scheduler, admin_info, user_input,
+                speculative=SPECULATIVE,
+                render=lambda text: response_placeholder.markdown(
+                    message_html("assistant", clean_response(text)), unsafe_allow_html=True
+                ),
+                mode=ASSISTANT_MODE
             )
-            if run_status.status == 'completed':
-                break
-            elif run_status.status == 'failed':
-                raise Exception("Assistant run failed")
-            time.sleep(0.5)
-        
-        # Get latest message
-        messages = client.beta.threads.messages.list(
-            thread_id=thread_id,
-            order="desc",
-            limit=1
-        )
-        return messages.data[0].content[0].text.value
-        
-    except Exception as e:
-        logger.error(f"Error running assistant: {str(e)}")
-        raise
 
-def process_user_query(client, thread, labeler, course_scheduler, admin_info, user_question):
-    """Process user query through dual assistant system"""
-    try:
-        # Create new thread for this interaction
-        thread = client.beta.threads.create()
-        
-        # Send user's question to labeler
-        client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=user_question
-        )
-        
-        # Get labeler's decision
-        label = int(run_assistant(client, thread.id, labeler.id))
-        
-        # Choose next assistant based on label
-        next_assistant = course_scheduler if label == 1 else admin_info
-        assistant_type = "Course Scheduler" if label == 1 else "Admin Info"
-        
-        # Get final response from chosen assistant
-        final_response = run_assistant(client, thread.id, next_assistant.id)
-        
-        return final_response, assistant_type
-        
-    except Exception as e:
-        error_msg = f"Error processing query: {str(e)}"
-        logger.error(error_msg)
-        return error_msg, "Error"
+            # Clean up the response
+            cleaned_response = clean_response(response)  # Remove source markers, style tags and extra whitespace
+
+            # Add to chat history
+            add_message("assistant", cleaned_response)
+
+            # Log the interaction
+            success = log_interaction(
+                sheets_service,
+                SPREADSHEET_ID,
+                user_input,
+                response,
+                st.session_state.sunet_id,
+                assistant_type
+            )
+
+            if not success:
+                st.warning("Failed to log this interaction. Please contact support if issues persist.")
+
+        except Exception as e:
+            st.error(f"An error occurred: {str(e)}")
+            add_message(
+                "assistant",
+                "I'm sorry, I encountered an error processing your request. Please try again later."
+            )
+
+        # Replace the streaming text or loading animation with the final message
+        response_placeholder.markdown(rendered_html(st.session_state.messages[-1]), unsafe_allow_html=True)
 
 def main_app():
     # Apply custom CSS
@@ -456,17 +359,17 @@ def main_app():
     """, unsafe_allow_html=True)
     
     # Initialize services
-    client, labeler, course_scheduler, admin_info, thread = initialize_assistants()
     sheets_service = get_google_sheets_service()
     
-    if not sheets_service:
+    if not sheets_service or not SPREADSHEET_ID:
         st.error("Failed to initialize Google Sheets service. Check your credentials.")
         return
         
-    spreadsheet_id = st.secrets["SPREADSHEET_ID"]
-    
-    # Initialize sheet if needed
-    initialize_sheet_if_needed(sheets_service, spreadsheet_id)
+    # Initialize sheet if needed, in the background while the assistants load
+    initialize_sheet_if_needed(sheets_service, SPREADSHEET_ID)
+
+    client, labeler, course_scheduler, admin_info = initialize_assistants(ASSISTANT_MODE)
+    label_cache = get_label_cache()
     
     # Create a container for chat content
     chat_container = st.container()
@@ -516,107 +419,46 @@ def main_app():
         with col1:
             if st.button("Clear Chat", use_container_width=True):
                 st.session_state.messages = []
-                thread = client.beta.threads.create()
+                st.session_state.rendered = {}
+                st.session_state.thread_ids = {}
                 st.rerun()
         
         with col2:
             if st.button("Logout", use_container_width=True):
                 st.session_state.authenticated = False
                 st.session_state.messages = []
+                st.session_state.rendered = {}
+                st.session_state.thread_ids = {}
                 st.rerun()
 
+    # Initialize prerendered message HTML, keyed by message id
+    if "rendered" not in st.session_state:
+        st.session_state.rendered = {}
+
     # Initialize chat history if not exists
     if "messages" not in st.session_state:
         st.session_state.messages = []
         # Add a welcome message
-        welcome_msg = {
-            "role": "assistant", 
-            "content": f"Hi {st.session_state.sunet_id}! I'm your Stanford Course Helper. How can I assist you with your academic planning today?"
-        }
-        st.session_state.messages.append(welcome_msg)
+        add_message(
+            "assistant",
+            f"Hi {st.session_state.sunet_id}! I'm your Stanford Course Helper. How can I assist you with your academic planning today?"
+        )
+
+    # Initialize this session's assistant threads, keyed by assistant id
+    if "thread_ids" not in st.session_state:
+        st.session_state.thread_ids = {}
 
     # Chat interface
     with chat_container:
-        # Chat messages area
-        chat_area = st.container()
-        
         # Display chat history
-        with chat_area:
-            for message in st.session_state.messages:
-                if message["role"] == "user":
-                    st.markdown(f"""
-                    <div class="user-message">
-                        <strong>You:</strong><br>{message["content"]}
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    st.markdown(f"""
-                    <div class="assistant-message">
-                        <strong>Course Helper:</strong><br>{message["content"]}
-                    </div>
-                    """, unsafe_allow_html=True)
-        
-        # Chat input
-        user_input = st.chat_input("Ask about courses or academic policies...")
-        
-        if user_input:
-            # Add user message to chat history
-            st.session_state.messages.append({"role": "user", "content": user_input})
-            
-            # Rerun to display user message
-            st.rerun()
-
-    # Process the user input after rerun to show the loading animation
-    if st.session_state.messages and st.session_state.messages[-1]["role"] == "user" and "processing" not in st.session_state:
-        st.session_state.processing = True
-        
-        # Get the last user message
-        prompt = st.session_state.messages[-1]["content"]
-        
-        # Display loading animation
-        with chat_container:
-            loading_placeholder = st.empty()
-            with loading_placeholder:
-                loading_animation()
-            
-            try:
-                # Process through dual assistant system
-                response, assistant_type = process_user_query(
-                    client, thread, labeler, course_scheduler, admin_info, prompt
-                )
+        for message in st.session_state.messages:
+            st.markdown(rendered_html(message), unsafe_allow_html=True)
 
-                # Clean up the response
-                cleaned_response = re.sub(r'【\d+:\d+†source】', '', response)  # Remove all source markers
-                cleaned_response = cleaned_response.replace("<userStyle>Normal</userStyle>", "")  # Remove style tags
-                cleaned_response = cleaned_response.strip()  # Remove any extra whitespace
-                
-                # Add to chat history
-                st.session_state.messages.append({"role": "assistant", "content": cleaned_response})
-                
-                # Log the interaction
-                success = log_interaction(
-                    sheets_service,
-                    spreadsheet_id,
-                    prompt,
-                    response,
-                    st.session_state.sunet_id,
-                    assistant_type
-                )
-                
-                if not success:
-                    st.warning("Failed to log this interaction. Please contact support if issues persist.")
-                    
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": "I'm sorry, I encountered an error processing your request. Please try again later."
-                })
-            
-            # Clear the loading animation and rerun to display the response
-            loading_placeholder.empty()
-            del st.session_state.processing
-            st.rerun()
+        # Chat input and new messages, rerun on their own as the user chats
+        chat_turn(
+            client, labeler, course_scheduler, admin_info, label_cache,
+            sheets_service, len(st.session_state.messages)
+        )
 
 # Main flow control
 if not st.session_state.authenticated: